@@ -17,19 +17,48 @@ Funcionalidades implementadas:
 """
 
 import socket
+import selectors
 import json
 import time
 import argparse
 from pathlib import Path
 import subprocess
 import logging
+import ctypes
+import ctypes.util
+import errno
+import os
+import heapq
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+# msgspec é opcional: descodifica o JSON diretamente para os tipos das mensagens,
+# validando-os pelo caminho, e codifica diretamente para bytes. Sem ele, usamos a
+# biblioteca json e validamos à mão (ver _decode_message).
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# pyroute2 é opcional: permite alterar a tabela do Kernel diretamente por netlink.
+# Sem ele, as rotas são aplicadas através do comando 'ip'.
+try:
+    from pyroute2 import IPRoute, NetlinkError
+except ImportError:
+    IPRoute = None
 
 # --- Constantes do Protocolo ---
 
-# UPDATE_INTERVAL: A frequência (em segundos) com que o roteador envia as suas
-# atualizações de tabela para os vizinhos.
+# UPDATE_INTERVAL: A frequência (em segundos) com que o roteador envia um 'hello'
+# aos vizinhos (ou a tabela completa, no modo --periodic).
 UPDATE_INTERVAL = 10
 
+# FULL_UPDATE_INTERVAL: No modo de atualizações disparadas, a tabela completa é mesmo
+# assim reenviada com esta frequência (em segundos), no lugar de um dos 'hello'. Sem
+# isto, uma rota envenenada nunca seria reaprendida depois do fim do hold-down (os
+# vizinhos não têm mudanças para anunciar) e uma atualização perdida nunca seria reposta.
+FULL_UPDATE_INTERVAL = 30
+
 # TIMEOUT_INTERVAL: O tempo (em segundos) que um roteador espera sem receber
 # notícias de um vizinho antes de o considerar offline.
 TIMEOUT_INTERVAL = 30
@@ -42,6 +71,19 @@ INFINITY = 999
 # informações sobre uma rota que acabou de falhar, para garantir a estabilidade da rede.
 HOLD_DOWN_INTERVAL = 60
 
+# SYNC_DEBOUNCE_INTERVAL: Durante a convergência chegam muitas atualizações em poucos
+# milissegundos. Só imprimimos a tabela e sincronizamos com o S.O. depois de a tabela
+# ficar este tempo (em segundos) sem mudar...
+SYNC_DEBOUNCE_INTERVAL = 0.2
+
+# SYNC_MAX_DELAY: ...mas nunca adiamos a sincronização mais do que isto (em segundos),
+# mesmo que as mudanças não parem.
+SYNC_MAX_DELAY = 1.0
+
+# NO_ROUTE: Valor sentinela em route_next_hop para um destino que ainda não conhecemos
+# (nunca aprendido), distinto de uma rota conhecida mas envenenada (custo INFINITY).
+NO_ROUTE = -1
+
 # --- Configuração do Logging ---
 # Define um formato de log que inclui o nome do logger, para que nos logs do
 # docker-compose seja fácil identificar qual roteador gerou a mensagem.
@@ -51,35 +93,128 @@ logging.basicConfig(
     datefmt="%H:%M:%S"
 )
 
+# --- Formato e Serialização das Mensagens ---
+
+class RouteInfo(NamedTuple):
+    """Uma rota anunciada numa atualização; no JSON é o triplo [dest, cost, next_hop]."""
+    dest: int
+    cost: float
+    next_hop: int
+
+@dataclass(slots=True)
+class WireMessage:
+    """
+    Uma mensagem do protocolo já validada. Os IDs são os índices inteiros do
+    network_map; 'hello' não traz tabela.
+    """
+    type: str
+    sender_id: int
+    table: list[RouteInfo] = field(default_factory=list)
+
+if msgspec is not None:
+    _message_decoder = msgspec.json.Decoder(WireMessage)
+    _message_encoder = msgspec.json.Encoder()
+
+def _encode_message(message: dict) -> bytes:
+    """
+    Serializa uma mensagem do protocolo para JSON em bytes, pronta para o socket.
+    Usa msgspec se estiver instalado e a biblioteca json caso contrário.
+    """
+    if msgspec is not None:
+        return _message_encoder.encode(message)
+    return json.dumps(message).encode("utf-8")
+
+def _decode_message(payload: bytes | memoryview) -> WireMessage:
+    """
+    Converte um datagrama recebido (JSON em bytes) numa WireMessage validada.
+    Aceita uma memoryview sobre o buffer de receção, que msgspec lê sem copiar.
+
+    Raises:
+        ValueError: Se o payload não for JSON válido ou não respeitar o formato.
+    """
+    if msgspec is not None:
+        try:
+            return _message_decoder.decode(payload)
+        except msgspec.DecodeError as exc: # Inclui msgspec.ValidationError
+            raise ValueError(str(exc)) from exc
+
+    data = json.loads(bytes(payload)) # json não aceita memoryview
+    if not isinstance(data, dict) or not isinstance(data.get("type"), str) or type(data.get("sender_id")) is not int:
+        raise ValueError("cabeçalho da mensagem inválido")
+    rows = data.get("table", [])
+    if not isinstance(rows, list):
+        raise ValueError("'table' deve ser uma lista")
+    table = []
+    for row in rows:
+        if not (isinstance(row, list) and len(row) == 3
+                and type(row[0]) is int and type(row[2]) is int
+                and type(row[1]) in (int, float)):
+            raise ValueError(f"rota inválida: {row!r}")
+        table.append(RouteInfo(row[0], float(row[1]), row[2]))
+    return WireMessage(data["type"], data["sender_id"], table)
+
 # --- Funções Auxiliares para Manipular Rotas do S.O. (Linux) ---
 
-def _run_ip_command(arguments: list[str], logger):
+def _run_ip_batch(commands: list[list[str]], logger):
     """
-    Executa um comando 'ip route' no shell do sistema operacional.
+    Executa um lote de comandos 'ip route' com um único processo 'ip -batch'.
 
     Esta é uma função auxiliar interna que encapsula a interação com o S.O.,
-    incluindo o tratamento de erros comuns.
+    incluindo o tratamento de erros comuns. Em vez de um fork/exec por rota,
+    todos os comandos são enviados pelo stdin de um só 'ip -force -batch -'.
 
     Args:
-        arguments (list[str]): Uma lista de argumentos a serem passados para 'ip route'.
+        commands (list[list[str]]): Os argumentos de cada comando 'ip route'
+            (ex: ["replace", "10.0.1.0/24", "via", "172.28.0.101"]).
         logger: A instância do logger do roteador para registar os resultados.
     """
-    cmd = ["ip", "route", *arguments]
+    if not commands:
+        return
+    script = "".join("route " + " ".join(arguments) + "\n" for arguments in commands)
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=5)
-        logger.debug("Comando executado: %s", " ".join(cmd))
+        # Com -force, o 'ip' continua após erros. Ignoramos assim erros comuns como
+        # "rota não existe ao tentar apagar" ou "rota já existe ao tentar adicionar",
+        # que são esperados durante a convergência.
+        subprocess.run(["ip", "-force", "-batch", "-"], input=script, check=False,
+                       capture_output=True, text=True, timeout=5)
+        logger.debug("Lote executado:\n%s", script)
     except FileNotFoundError:
         logger.error("Comando 'ip' não encontrado. Este script deve rodar num container Linux.")
-    except subprocess.CalledProcessError:
-        # Ignora erros comuns como "rota não existe ao tentar apagar" ou
-        # "rota já existe ao tentar adicionar", que são esperados durante a convergência.
-        pass
     except Exception as exc:
-        logger.error(f"Erro inesperado ao executar '{' '.join(cmd)}': {exc}")
+        logger.error(f"Erro inesperado ao executar o lote 'ip -batch': {exc}")
+
+def _apply_route_commands(commands: list[list[str]], logger, ipr=None):
+    """
+    Aplica um lote de comandos de rota no Kernel.
+
+    Com um handle pyroute2 (ipr), cada comando torna-se uma única mensagem netlink
+    RTM_NEWROUTE/RTM_DELROUTE; sem ele, o lote é entregue a _run_ip_batch.
 
-def add_route(destination_prefix: str, next_hop_ip: str, logger):
+    Args:
+        commands (list[list[str]]): Os comandos no formato de argumentos de 'ip route'.
+        logger: A instância do logger do roteador para registar os resultados.
+        ipr: Um pyroute2.IPRoute partilhado, ou None para usar o comando 'ip'.
     """
-    Adiciona ou substitui uma rota na tabela de roteamento do Kernel.
+    if ipr is None:
+        _run_ip_batch(commands, logger)
+        return
+    for arguments in commands:
+        try:
+            if arguments[0] == "replace":
+                ipr.route("replace", dst=arguments[1], gateway=arguments[3])
+            else:
+                ipr.route("del", dst=arguments[1])
+            logger.debug("Netlink: route %s", " ".join(arguments))
+        except NetlinkError:
+            # Tal como no comando 'ip', ignoramos "rota não existe" / "rota já existe",
+            # que são esperados durante a convergência.
+            pass
+        except Exception as exc:
+            logger.error(f"Erro inesperado ao aplicar 'route {' '.join(arguments)}' por netlink: {exc}")
+
+def add_route(destination_prefix: str, next_hop_ip: str, logger, batch: list):
+    """
+    Agenda a adição ou substituição de uma rota na tabela de roteamento do Kernel.
 
     Usa o comando 'ip route replace' que é idempontente: funciona para adicionar uma
     rota nova ou para modificar uma já existente.
@@ -88,20 +223,113 @@ def add_route(destination_prefix: str, next_hop_ip: str, logger):
         destination_prefix (str): A rede de destino (ex: "10.0.1.0/24").
         next_hop_ip (str): O endereço IP do próximo salto.
         logger: A instância do logger do roteador.
+        batch (list): O lote de comandos a aplicar depois com _apply_route_commands.
     """
     logger.info(f"SINC S.O.: Adicionando/Trocando rota para {destination_prefix} via {next_hop_ip}")
-    _run_ip_command(["replace", destination_prefix, "via", next_hop_ip], logger)
+    batch.append(["replace", destination_prefix, "via", next_hop_ip])
 
-def delete_route(destination_prefix: str, logger):
+def delete_route(destination_prefix: str, logger, batch: list):
     """
-    Remove uma rota da tabela de roteamento do Kernel.
+    Agenda a remoção de uma rota da tabela de roteamento do Kernel.
 
     Args:
         destination_prefix (str): A rede de destino a ser removida.
         logger: A instância do logger do roteador.
+        batch (list): O lote de comandos a aplicar depois com _apply_route_commands.
     """
     logger.info(f"SINC S.O.: Removendo rota para {destination_prefix}")
-    _run_ip_command(["del", destination_prefix], logger)
+    batch.append(["del", destination_prefix])
+
+# --- Funções Auxiliares para Envio em Lote (sendmmsg) ---
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_ushort), # Em ordem de bytes da rede
+        ("sin_addr", ctypes.c_ubyte * 4),
+        ("sin_zero", ctypes.c_ubyte * 8),
+    ]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _libc_sendmmsg = _libc.sendmmsg
+    _libc_sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    _libc_sendmmsg.restype = ctypes.c_int
+except (OSError, AttributeError):
+    _libc_sendmmsg = None # Sistema sem glibc/sendmmsg: o chamador usa sendto.
+
+def _sendmmsg(fd: int, messages: list[tuple[bytes, tuple[str, int]]]) -> int:
+    """
+    Envia vários datagramas UDP/IPv4 com uma única chamada de sistema sendmmsg(2).
+
+    Args:
+        fd (int): O descritor do socket.
+        messages (list): Pares (payload, (ip, porta)) a enviar.
+
+    Returns:
+        int: Quantos datagramas (a contar do início da lista) foram enviados.
+             Pode ser menor que len(messages) se o kernel parar a meio.
+
+    Raises:
+        OSError: Se sendmmsg não estiver disponível ou falhar logo no primeiro datagrama.
+    """
+    if _libc_sendmmsg is None:
+        raise OSError(errno.ENOSYS, "sendmmsg indisponível")
+    count = len(messages)
+    if count == 0:
+        return 0
+
+    # Os buffers têm de continuar vivos até o kernel terminar a chamada.
+    buffers = [ctypes.create_string_buffer(payload, len(payload)) for payload, _ in messages]
+    iovecs = (_IoVec * count)()
+    addrs = (_SockAddrIn * count)()
+    headers = (_MMsgHdr * count)()
+    for i, (payload, (ip, port)) in enumerate(messages):
+        iovecs[i].iov_base = ctypes.cast(buffers[i], ctypes.c_void_p)
+        iovecs[i].iov_len = len(payload)
+        addrs[i].sin_family = socket.AF_INET
+        addrs[i].sin_port = socket.htons(port)
+        addrs[i].sin_addr[:] = socket.inet_aton(ip)
+        hdr = headers[i].msg_hdr
+        hdr.msg_name = ctypes.cast(ctypes.byref(addrs[i]), ctypes.c_void_p)
+        hdr.msg_namelen = ctypes.sizeof(_SockAddrIn)
+        hdr.msg_iov = ctypes.pointer(iovecs[i])
+        hdr.msg_iovlen = 1
+
+    sent = _libc_sendmmsg(fd, headers, count, 0)
+    if sent < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return sent
+
+# --- Estado dos Vizinhos ---
+
+@dataclass(slots=True)
+class Neighbor:
+    """O estado de um vizinho direto, tal como configurado e observado."""
+    ip: str
+    port: int
+    metrics: dict
+    cost: float = 0.0 # Custo composto do link, calculado pelo roteador
+    last_seen: float = 0.0 # Hora (monotónica) da última mensagem; 0 = offline
+    version: int = 0 # Incrementada a cada last_seen, para invalidar prazos antigos
 
 # --- Classe Principal do Roteador ---
 
@@ -110,146 +338,316 @@ class SimpleRouter:
     Encapsula o estado e a lógica de um roteador que executa um protocolo
     de roteamento dinâmico do tipo Vetor de Distância.
     """
-    def __init__(self, config_path: Path):
+    def __init__(self, config_path: Path, periodic: bool = False):
         """
         Inicializa o roteador a partir de um arquivo de configuração JSON.
 
         Args:
             config_path (Path): O caminho para o arquivo de configuração.
+            periodic (bool): Se True, envia a tabela completa a cada UPDATE_INTERVAL
+                (comportamento antigo). Se False, a tabela é enviada quando muda e a cada
+                FULL_UPDATE_INTERVAL, e a vivacidade é mantida com mensagens 'hello'.
         """
         with config_path.open("r") as f:
             config = json.load(f)
 
         # --- Estado Fundamental ---
         self.router_id = config["router_id"]  # O nome deste roteador (ex: "r1")
+        self.periodic = periodic # Modo de envio da tabela (ver docstring)
         self.logger = logging.getLogger(self.router_id) # Logger específico para esta instância
         self.network_map = config["network_map"] # Mapeamento de IDs para prefixos de rede
 
         # --- Estado da Rede ---
-        # Dicionário com informações sobre os vizinhos diretos
+        # Dicionário (índice do vizinho -> Neighbor) com os vizinhos diretos
         self.neighbors = {}
-        # Dicionário com a tabela de roteamento calculada
-        self.routing_table = {self.router_id: {"cost": 0, "next_hop": self.router_id}}
-        # Dicionário que armazena as rotas que este script instalou no S.O.
-        self.installed_routes = {}
-        # Dicionário para rastrear rotas em hold-down para evitar instabilidade
+
+        # --- IDs Inteiros e Tabela de Roteamento (Estrutura de Arrays) ---
+        # Cada ID de roteador recebe um índice inteiro, atribuído pela ordem alfabética
+        # do network_map. Como todos os roteadores partilham o mesmo network_map, os
+        # índices coincidem em toda a rede e são usados tanto em memória como nas
+        # mensagens; os nomes ("r1", ...) só voltam a aparecer nos logs.
+        self.idx_to_id = sorted(self.network_map)
+        self.id_to_idx = {rid: i for i, rid in enumerate(self.idx_to_id)}
+        unknown_ids = {self.router_id, *(n["id"] for n in config["neighbors"])} - self.id_to_idx.keys()
+        if unknown_ids:
+            raise ValueError(f"IDs ausentes do network_map em {config_path}: {sorted(unknown_ids)}")
+        # A tabela é guardada em duas listas paralelas indexadas pelo índice do destino.
+        self.router_idx = self.id_to_idx[self.router_id]
+        # Custo até cada destino (INFINITY se inalcançável ou desconhecido).
+        self.route_cost = [INFINITY] * len(self.idx_to_id)
+        # Índice do próximo salto para cada destino (NO_ROUTE se desconhecido).
+        self.route_next_hop = [NO_ROUTE] * len(self.idx_to_id)
+        self.route_cost[self.router_idx] = 0
+        self.route_next_hop[self.router_idx] = self.router_idx
+        # Índice inverso: próximo salto -> destinos que passam por ele. Mantido em cada
+        # mudança de próximo salto (ver _set_next_hop); a rota para nós próprios fica de fora.
+        # Usado pelo Poison Reverse no envio e pelo envenenamento de rotas nos timeouts.
+        self._routes_by_next_hop = {}
+        # Prefixo de rede de cada destino, pré-calculado por índice a partir do network_map.
+        self._prefix_for_idx = [self.network_map[rid] for rid in self.idx_to_id]
+        # Lista (índice do destino -> IP do próximo salto) com as rotas que este script
+        # instalou no S.O.; None se não houver rota instalada para esse destino.
+        self.installed_routes = [None] * len(self.idx_to_id)
+        # Índices dos destinos alterados desde a última sincronização com o S.O.;
+        # preenchido nos pontos onde a tabela muda e esvaziado por sync_os_routes.
+        self._pending_os_ops = set()
+        # Handle netlink partilhado durante toda a vida do roteador (None = usar 'ip').
+        self._ipr = None
+        if IPRoute is not None:
+            try:
+                self._ipr = IPRoute()
+            except Exception as exc:
+                self.logger.warning(f"Netlink indisponível ({exc}); a usar o comando 'ip'.")
+        # Dicionário (índice do destino -> início) para rastrear rotas em hold-down
+        # e evitar instabilidade
         self.hold_down_timers = {}
 
+        # --- Filas de Expiração (heaps ordenados por prazo) ---
+        # Em vez de verificar todos os vizinhos/destinos a cada ciclo, guardamos os prazos
+        # num heap e só olhamos para o topo. Entradas obsoletas (um vizinho que entretanto
+        # voltou a falar, um hold-down reiniciado) são simplesmente descartadas ao sair.
+        # Entradas (prazo, índice do vizinho, versão do last_seen).
+        self._expiry_heap = []
+        # Entradas (prazo, índice do destino, início do hold-down).
+        self._hold_down_heap = []
+        # Cache dos datagramas de atualização já serializados, um por vizinho.
+        # Só é reconstruída quando a tabela muda (_table_dirty).
+        self._payload_by_neighbor = {}
+        self._table_dirty = True
+        # A mensagem 'hello' nunca muda, por isso é serializada uma única vez.
+        self._hello_payload = _encode_message({"type": "hello", "sender_id": self.router_idx})
+
         # --- Configuração de Rede ---
         self.listen_ip = "0.0.0.0" # Ouve em todas as interfaces
         self.listen_port = config["listen_port"]
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((self.listen_ip, self.listen_port))
-        self.sock.settimeout(1.0) # Evita que o loop principal bloqueie para sempre
+        # O socket é não-bloqueante: o loop principal espera no seletor (epoll no Linux)
+        # e só lê do socket quando o kernel indica que há datagramas prontos.
+        self.sock.setblocking(False)
+        self._sel = selectors.DefaultSelector()
+        self._sel.register(self.sock, selectors.EVENT_READ)
+        # Buffer de receção reutilizado para todos os datagramas (tamanho máximo UDP),
+        # evitando alocar um bytes novo por pacote.
+        self._recv_buf = bytearray(65535)
+        self._recv_mv = memoryview(self._recv_buf)
 
         # --- Controlo de Temporizadores ---
-        self.last_update_sent = 0.0 # Hora do último envio de atualização
+        # Todos os temporizadores do protocolo usam time.monotonic(), que nunca anda para
+        # trás com acertos do relógio (NTP); a hora real só aparece nos logs.
+        self.last_update_sent = 0.0 # Hora do último envio (tabela ou hello)
+        self.last_full_update_sent = 0.0 # Hora do último envio da tabela completa
+        # Mudanças da tabela ainda por imprimir/sincronizar com o S.O. (ver SYNC_*):
+        self._dirty_since = None # Hora da primeira mudança pendente (None = nada pendente)
+        self._last_change = 0.0 # Hora da mudança pendente mais recente
 
         # --- Lógica de Inicialização de Custos ---
         # Passo 1: Construir o dicionário de vizinhos primeiro, sem o custo.
         # Isto é necessário para que o cálculo do custo de congestão (len(self.neighbors))
         # seja consistente e não dependa da ordem dos vizinhos no arquivo JSON.
         for neighbor in config["neighbors"]:
-            neighbor_id = neighbor["id"]
-            self.neighbors[neighbor_id] = {
-                "ip": neighbor["ip"],
-                "port": neighbor["port"],
-                "metrics": neighbor["metrics"],
-                "last_seen": 0.0,
-            }
-
-        # Passo 2: Agora que self.neighbors está completo, podemos calcular o custo
-        # de cada link de forma consistente.
-        for neighbor_id in self.neighbors:
-            metrics = self.neighbors[neighbor_id]["metrics"]
-            self.neighbors[neighbor_id]["cost"] = self._calculate_composite_cost(metrics)
+            neighbor_idx = self.id_to_idx[neighbor["id"]]
+            self.neighbors[neighbor_idx] = Neighbor(
+                ip=neighbor["ip"], port=neighbor["port"], metrics=neighbor["metrics"]
+            )
+
+        # Passo 2: Agora que self.neighbors está completo, a congestão fica fixa e podemos
+        # calcular o custo de cada link de forma consistente.
+        link_cost = self._composite_cost_function()
+        for neighbor in self.neighbors.values():
+            neighbor.cost = link_cost(neighbor.metrics)
         
         self.logger.info(f"Roteador iniciado. Ouvindo em {self.listen_ip}:{self.listen_port}")
 
-    # Dentro da classe SimpleRouter, substitua este método:
+    def _set_next_hop(self, dest_idx: int, next_hop_idx: int):
+        """
+        Altera o próximo salto de um destino, mantendo o índice inverso
+        _routes_by_next_hop sincronizado.
+        """
+        old_next_hop = self.route_next_hop[dest_idx]
+        if old_next_hop == next_hop_idx:
+            return
+        if old_next_hop != NO_ROUTE:
+            self._routes_by_next_hop[old_next_hop].discard(dest_idx)
+        self._routes_by_next_hop.setdefault(next_hop_idx, set()).add(dest_idx)
+        self.route_next_hop[dest_idx] = next_hop_idx
+
+    def _export_table(self) -> list:
+        """
+        Converte a tabela de roteamento para o formato usado nas mensagens: uma lista
+        de triplos [destino, custo, próximo salto] com índices inteiros, omitindo os
+        destinos que nunca foram aprendidos.
+        """
+        return [
+            [i, cost, next_hop]
+            for i, (cost, next_hop) in enumerate(zip(self.route_cost, self.route_next_hop))
+            if next_hop != NO_ROUTE
+        ]
 
-    def _calculate_composite_cost(self, metrics: dict) -> float:
+    def _congestion_cost(self) -> float:
         """
-        Calcula um custo composto com base em várias métricas,
-        agora com um cálculo de congestão dinâmico.
+        Calcula a penalidade de congestão, que depende do número de vizinhos ativos.
         """
-        latency = metrics.get("latency_ms", 500)
-        bandwidth = metrics.get("bandwidth_mbps", 1)
-        bandwidth_cost = 1000 / bandwidth
-        
         # --- LÓGICA DE CONGESTÃO DINÂMICA ---
         # Conta apenas os vizinhos que foram vistos recentemente (estão ativos)
-        # Um vizinho é considerado ativo se foi visto no último período de TIMEOUT
-        now = time.time()
+        # Um vizinho é considerado ativo se foi visto no último período de TIMEOUT.
+        # last_seen == 0 significa "nunca visto" (ou expirado), não um instante: o
+        # relógio monotónico pode estar abaixo de TIMEOUT_INTERVAL logo após o boot.
+        now = time.monotonic()
         active_neighbors_count = 0
         for neighbor in self.neighbors.values():
-            if (now - neighbor["last_seen"]) < TIMEOUT_INTERVAL:
+            if neighbor.last_seen and now - neighbor.last_seen < TIMEOUT_INTERVAL:
                 active_neighbors_count += 1
 
         # No arranque, last_seen é 0, então contamos os vizinhos configurados
-        if active_neighbors_count == 0 and all(n["last_seen"] == 0 for n in self.neighbors.values()):
-            congestion_cost = len(self.neighbors) * 0.5
-        else:
-            congestion_cost = active_neighbors_count * 0.5
+        if active_neighbors_count == 0 and all(n.last_seen == 0 for n in self.neighbors.values()):
+            return len(self.neighbors) * 0.5
+        return active_neighbors_count * 0.5
 
-        return latency + bandwidth_cost + congestion_cost
+    def _composite_cost_function(self):
+        """
+        Devolve uma função que calcula o custo composto de um link a partir das suas
+        métricas (latência, largura de banda e congestão).
+
+        A congestão é igual para todos os links enquanto o conjunto de vizinhos ativos
+        não muda, por isso é calculada uma única vez e fica fixa na função devolvida.
+        Quem a usa deve pedir uma nova função sempre que a topologia de vizinhos mudar.
+        """
+        congestion_cost = self._congestion_cost()
+
+        def _cost(metrics: dict, _congestion=congestion_cost) -> float:
+            return metrics.get("latency_ms", 500) + 1000 / metrics.get("bandwidth_mbps", 1) + _congestion
+
+        return _cost
 
     def send_routing_updates(self):
         """
         Envia a tabela de roteamento para cada vizinho, aplicando a regra do
         Split Horizon com Poison Reverse para evitar loops de roteamento.
+
+        A tabela base é construída e serializada uma única vez e partilhada por todos
+        os vizinhos que não são próximo salto de nenhuma rota; os restantes recebem-na
+        com as suas rotas envenenadas por cima. O resultado fica em cache até a
+        tabela mudar. Todos os datagramas seguem numa só chamada sendmmsg, com sendto
+        como alternativa.
         """
-        # Itera por cada vizinho para lhe enviar uma tabela de roteamento customizada.
-        for neighbor_id in self.neighbors.keys():
-            table_for_neighbor = {}
-            # Itera pela nossa tabela de roteamento principal para decidir o que enviar.
-            for dest, route_info in self.routing_table.items():
+        # Só voltamos a serializar se a tabela mudou desde o último envio.
+        if self._table_dirty or not self._payload_by_neighbor:
+            # A tabela base é construída uma vez; para cada vizinho só acrescentamos
+            # por cima as rotas que passam por ele (dadas pelo índice inverso).
+            base_table = self._export_table()
+            # Posição de cada destino dentro de base_table, para substituir entradas.
+            row_for_dest = {row[0]: pos for pos, row in enumerate(base_table)}
+            base_payload = None
+            for neighbor_idx in self.neighbors:
                 # A REGRA DO SPLIT HORIZON COM POISON REVERSE:
                 # Se o próximo salto para um destino é o próprio vizinho para quem estamos
                 # a enviar a mensagem, anunciamos essa rota de volta, mas com um custo infinito.
                 # Isto avisa o vizinho para nunca tentar usar-nos como um caminho de volta.
-                if dest != self.router_id and route_info.get("next_hop") == neighbor_id:
-                    table_for_neighbor[dest] = {"cost": INFINITY, "next_hop": route_info["next_hop"]}
+                poisoned = self._routes_by_next_hop.get(neighbor_idx)
+                if poisoned:
+                    table_for_neighbor = base_table.copy()
+                    for dest_idx in poisoned:
+                        table_for_neighbor[row_for_dest[dest_idx]] = [dest_idx, INFINITY, neighbor_idx]
+                    message = {"type": "update", "sender_id": self.router_idx, "table": table_for_neighbor}
+                    payload = _encode_message(message)
                 else:
-                    table_for_neighbor[dest] = route_info
-            
-            message = {"type": "update", "sender_id": self.router_id, "table": table_for_neighbor}
-            payload = json.dumps(message).encode("utf-8")
+                    if base_payload is None:
+                        message = {"type": "update", "sender_id": self.router_idx, "table": base_table}
+                        base_payload = _encode_message(message)
+                    payload = base_payload
+                self._payload_by_neighbor[neighbor_idx] = payload
+
+            self._table_dirty = False
+
+        datagrams = [
+            (self._payload_by_neighbor[neighbor_idx], (neighbor.ip, neighbor.port))
+            for neighbor_idx, neighbor in self.neighbors.items()
+        ]
+        self._send_datagrams(datagrams)
+        self.last_full_update_sent = self.last_update_sent
+
+    def send_periodic_message(self):
+        """
+        Envia a mensagem periódica (a cada UPDATE_INTERVAL): a tabela completa no modo
+        --periodic ou quando passou FULL_UPDATE_INTERVAL desde o último envio dela;
+        caso contrário, apenas um 'hello'.
+        """
+        if self.periodic or time.monotonic() - self.last_full_update_sent >= FULL_UPDATE_INTERVAL:
+            self.send_routing_updates()
+        else:
+            self.send_hello()
+
+    def send_hello(self):
+        """
+        Envia a mensagem 'hello' a todos os vizinhos. Serve apenas para provar que
+        estamos vivos quando a tabela não mudou e, por isso, não há atualização a enviar.
+        """
+        self._send_datagrams([
+            (self._hello_payload, (neighbor.ip, neighbor.port))
+            for neighbor in self.neighbors.values()
+        ])
+
+    def _send_datagrams(self, datagrams: list[tuple[bytes, tuple[str, int]]]):
+        """
+        Envia um lote de datagramas aos vizinhos e regista a hora do envio.
+
+        Args:
+            datagrams (list): Pares (payload, (ip, porta)).
+        """
+        sent = 0
+        try:
+            sent = _sendmmsg(self.sock.fileno(), datagrams)
+        except OSError:
+            pass # sendmmsg indisponível ou falhou: enviamos um a um abaixo.
+        for payload, address in datagrams[sent:]:
             try:
-                self.sock.sendto(payload, (self.neighbors[neighbor_id]["ip"], self.neighbors[neighbor_id]["port"]))
+                self.sock.sendto(payload, address)
             except OSError:
                 pass # Ignora erros se o socket estiver ocupado ou o vizinho não for alcançável
-        self.last_update_sent = time.time()
+        self.last_update_sent = time.monotonic()
 
     # Dentro da classe SimpleRouter:
 
-    def process_incoming_message(self, payload: bytes, source_address: tuple) -> bool:
+    def process_incoming_message(self, payload: bytes | memoryview, source_address: tuple) -> bool:
         """
-        Processa uma atualização de tabela recebida de um vizinho, aplicando as
-        regras de atualização do algoritmo de Vetor de Distância.
+        Processa uma mensagem recebida de um vizinho. Tanto 'hello' como 'update'
+        provam que o vizinho está vivo; um 'update' traz também a tabela, à qual
+        aplicamos as regras de atualização do algoritmo de Vetor de Distância.
         
+        O payload pode ser uma memoryview sobre o buffer de receção partilhado; só
+        é válido durante esta chamada.
+
         Returns:
             bool: True se a tabela de roteamento foi alterada, False caso contrário.
         """
         try:
-            message = json.loads(payload.decode("utf-8"))
-            sender_id = message["sender_id"]
-            neighbor_table = message["table"]
-        except (json.JSONDecodeError, KeyError):
+            message = _decode_message(payload)
+        except ValueError:
             self.logger.warning(f"Pacote malformado recebido de {source_address}")
             return False
-        if sender_id not in self.neighbors:
+        if message.type not in ("hello", "update"):
+            self.logger.warning(f"Mensagem de tipo desconhecido '{message.type}' recebida de {source_address}")
             return False
+        sender_idx = message.sender_id
+        if sender_idx not in self.neighbors:
+            return False
+        sender_id = self.idx_to_id[sender_idx] # Apenas para os logs
         
         table_changed = False
 
         # --- LÓGICA DE DETEÇÃO DE VIZINHO RECUPERADO ---
         # Verificamos se o vizinho estava offline (last_seen == 0) antes desta mensagem.
         # O last_seen é zerado pela função de timeout.
-        was_offline = self.neighbors[sender_id]["last_seen"] == 0
+        neighbor = self.neighbors[sender_idx]
+        was_offline = neighbor.last_seen == 0
         
-        # Atualizamos o timestamp do vizinho, provando que ele está online.
-        self.neighbors[sender_id]["last_seen"] = time.time()
+        # Atualizamos o timestamp do vizinho, provando que ele está online, e agendamos
+        # o seu novo prazo de timeout (o anterior fica obsoleto pela versão).
+        now = time.monotonic()
+        neighbor.last_seen = now
+        neighbor.version += 1
+        heapq.heappush(self._expiry_heap, (now + TIMEOUT_INTERVAL, sender_idx, neighbor.version))
         
         # Se ele estava offline, a nossa contagem de vizinhos ativos mudou, então
         # recalculamos os custos dos nossos links de saída.
@@ -259,48 +657,74 @@ class SimpleRouter:
             # Forçamos uma atualização para que a rede saiba dos nossos novos custos.
             table_changed = True
 
-        cost_to_neighbor = self.neighbors[sender_id]["cost"]
+        # Ligações locais para o ciclo abaixo, que corre uma vez por rota anunciada:
+        # ler uma variável local é mais barato do que resolver self.<atributo>.
+        cost_to_neighbor = neighbor.cost
+        route_cost = self.route_cost
+        route_next_hop = self.route_next_hop
+        hold_down_timers = self.hold_down_timers
+        pending_os_ops = self._pending_os_ops
+        set_next_hop = self._set_next_hop
+        router_idx = self.router_idx
+        infinity = INFINITY
+        num_destinations = len(route_cost)
+        knows_us = False
 
         # Itera por cada rota anunciada pelo vizinho.
-        for destination, info in neighbor_table.items():
+        for dest_idx, advertised_cost, advertised_next_hop in message.table:
+            # Ignora destinos fora do network_map (configuração inconsistente).
+            if not 0 <= dest_idx < num_destinations:
+                continue
+            if dest_idx == router_idx:
+                knows_us = True
+
             # --- LÓGICA DE HOLD-DOWN TIMER ---
             # Se a rota está em "hold-down", ignoramos completamente a atualização
             # para dar tempo à "má notícia" de se propagar pela rede.
-            if destination in self.hold_down_timers:
-                if time.time() - self.hold_down_timers[destination] < HOLD_DOWN_INTERVAL:
-                    continue
-                else:
-                    # O timer expirou, podemos voltar a considerar atualizações para este destino.
-                    del self.hold_down_timers[destination]
+            # (Os timers expirados são retirados por expire_hold_down_timers.)
+            if dest_idx in hold_down_timers:
+                continue
             
             # --- LÓGICA DE SPLIT HORIZON (RECEBIMENTO) ---
             # Ignora rotas que o vizinho está a tentar aprender de nós.
-            if info.get("next_hop") == self.router_id:
+            if advertised_next_hop == router_idx:
                 continue
 
-            new_cost = cost_to_neighbor + info["cost"]
-            current_route = self.routing_table.get(destination)
+            new_cost = cost_to_neighbor + advertised_cost
+            current_next_hop = route_next_hop[dest_idx]
 
             # CASO 1: Não conhecemos este destino. Se a rota for válida, aprendemos.
-            if not current_route:
-                if new_cost < INFINITY:
-                    self.routing_table[destination] = {"cost": new_cost, "next_hop": sender_id}
+            if current_next_hop == NO_ROUTE:
+                if new_cost < infinity:
+                    route_cost[dest_idx] = new_cost
+                    set_next_hop(dest_idx, sender_idx)
+                    pending_os_ops.add(dest_idx)
                     table_changed = True
                 continue
 
             # CASO 2: A atualização veio do nosso 'guia' atual (next_hop) para este destino.
             # Confiamos sempre nele, quer a notícia seja boa (custo menor) ou má (custo maior/infinito).
-            if current_route.get("next_hop") == sender_id:
-                if current_route["cost"] != new_cost:
-                    current_route["cost"] = new_cost
+            if current_next_hop == sender_idx:
+                if route_cost[dest_idx] != new_cost:
+                    route_cost[dest_idx] = new_cost
+                    pending_os_ops.add(dest_idx)
                     table_changed = True
             
             # CASO 3: A atualização veio de outro roteador.
             # Só aceitamos a sua palavra se o caminho que ele oferece for estritamente melhor.
-            elif new_cost < current_route["cost"]:
-                self.routing_table[destination] = {"cost": new_cost, "next_hop": sender_id}
+            elif new_cost < route_cost[dest_idx]:
+                route_cost[dest_idx] = new_cost
+                set_next_hop(dest_idx, sender_idx)
+                pending_os_ops.add(dest_idx)
                 table_changed = True
-                
+
+        # Se o vizinho nos envia uma tabela onde nós nem aparecemos, ele acabou de
+        # (re)arrancar sem ter dado timeout: reenviamos a nossa tabela para ele a aprender.
+        if message.type == "update" and not knows_us:
+            self._table_dirty = True
+
+        if table_changed:
+            self._table_dirty = True # Invalida a cache de datagramas serializados.
         return table_changed
 
     def _recalculate_link_costs(self):
@@ -310,132 +734,237 @@ class SimpleRouter:
         """
         self.logger.info("A recalcular custos de link devido a mudança na topologia de vizinhos.")
         # Itera por todos os vizinhos e atualiza o seu custo de link guardado
-        for neighbor_id in self.neighbors:
-            new_cost = self._calculate_composite_cost(self.neighbors[neighbor_id]["metrics"])
-            self.neighbors[neighbor_id]["cost"] = new_cost
+        link_cost = self._composite_cost_function()
+        for neighbor in self.neighbors.values():
+            neighbor.cost = link_cost(neighbor.metrics)
             
 
     def check_neighbor_timeouts(self) -> bool:
         """
         Verifica se algum vizinho ficou offline (timeout), envenena as rotas que
         dependiam dele e inicia os timers de Hold-Down e recalcula os custos de link se necessário.
+
+        Só são examinados os prazos vencidos no topo de _expiry_heap.
         """
         table_changed = False
-        now = time.time()
+        now = time.monotonic()
         
         # Usamos uma flag para saber se algum vizinho caiu nesta verificação
         any_timeout_detected = False
         
-        for neighbor_id in self.neighbors.keys():
-            # A condição verifica se já recebemos alguma mensagem deste vizinho e se o tempo
-            # desde a última mensagem é maior que o intervalo de timeout.
-            if self.neighbors[neighbor_id]["last_seen"] > 0 and now - self.neighbors[neighbor_id]["last_seen"] > TIMEOUT_INTERVAL:
+        expiry_heap = self._expiry_heap
+        while expiry_heap and expiry_heap[0][0] <= now:
+            _, neighbor_idx, version = heapq.heappop(expiry_heap)
+            neighbor = self.neighbors[neighbor_idx]
+            # Um prazo só vale se o vizinho não tiver falado desde que foi agendado.
+            if version == neighbor.version and neighbor.last_seen > 0:
                 any_timeout_detected = True # Marcamos que uma mudança na topologia ocorreu
-                self.logger.info(f"TIMEOUT! Vizinho {neighbor_id} parece estar offline.")
-                for dest, info in self.routing_table.items():
-                    # Para cada rota na nossa tabela que usava o vizinho morto como próximo salto...
-                    if info.get("next_hop") == neighbor_id and info.get("cost", 0) < INFINITY:
+                self.logger.info(f"TIMEOUT! Vizinho {self.idx_to_id[neighbor_idx]} parece estar offline.")
+                # O índice inverso dá-nos diretamente as rotas que usavam o vizinho morto
+                # como próximo salto, sem percorrer a tabela inteira.
+                for dest_idx in self._routes_by_next_hop.get(neighbor_idx, ()):
+                    # Para cada uma dessas rotas que ainda seja válida...
+                    if self.route_cost[dest_idx] < INFINITY:
                         # ...envenenamos a rota e iniciamos o timer de hold-down.
-                        self.logger.info(f"Envenenando rota para {dest} e iniciando Hold-Down.")
-                        info["cost"] = INFINITY
-                        self.hold_down_timers[dest] = now
+                        self.logger.info(f"Envenenando rota para {self.idx_to_id[dest_idx]} e iniciando Hold-Down.")
+                        self.route_cost[dest_idx] = INFINITY
+                        self.hold_down_timers[dest_idx] = now
+                        heapq.heappush(self._hold_down_heap, (now + HOLD_DOWN_INTERVAL, dest_idx, now))
+                        self._pending_os_ops.add(dest_idx)
                         table_changed = True
                 # Resetamos o timestamp para não disparar o timeout repetidamente.
-                self.neighbors[neighbor_id]["last_seen"] = 0
+                neighbor.last_seen = 0
                 
         # Se pelo menos um vizinho deu timeout, então o nosso número de vizinhos mudou.
         # Por isso, recalculamos os nossos custos de link.
         if any_timeout_detected:
             self._recalculate_link_costs()
-            
+
+        if table_changed:
+            self._table_dirty = True # Invalida a cache de datagramas serializados.
         return table_changed
 
+    def expire_hold_down_timers(self):
+        """
+        Retira os hold-down timers cujo prazo já passou, voltando a aceitar
+        atualizações para esses destinos. Tal como nos timeouts, só o topo do
+        heap é examinado.
+        """
+        now = time.monotonic()
+        hold_down_heap = self._hold_down_heap
+        while hold_down_heap and hold_down_heap[0][0] <= now:
+            _, dest_idx, started = heapq.heappop(hold_down_heap)
+            # Ignora entradas de um hold-down que entretanto foi reiniciado.
+            if self.hold_down_timers.get(dest_idx) == started:
+                del self.hold_down_timers[dest_idx]
+
     def print_routing_table(self):
         """
         Imprime a tabela de roteamento formatada para o log, omitindo rotas
         inválidas (com custo infinito) para uma visualização mais limpa.
+
+        Se o nível INFO não estiver ativo, não formata nada.
         """
-        table_str = "\n" + "="*55 + f"\nTabela de Roteamento em {time.strftime('%H:%M:%S')}\n" + "="*55 + "\n"
-        table_str += f"{'Destino':<10} | {'Custo':<10} | {'Próximo Salto':<15}\n" + "-"*55 + "\n"
-        
-        # Cria uma cópia temporária da tabela, incluindo apenas as rotas válidas.
-        valid_routes = {dest: info for dest, info in self.routing_table.items() if info.get("cost", 0) < INFINITY}
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+
+        parts = [
+            "\n" + "="*55 + f"\nTabela de Roteamento em {time.strftime('%H:%M:%S', time.localtime())}\n" + "="*55 + "\n",
+            f"{'Destino':<10} | {'Custo':<10} | {'Próximo Salto':<15}\n" + "-"*55 + "\n",
+        ]
         
-        if not valid_routes:
-            table_str += " (Nenhuma rota válida conhecida)\n"
-            
-        # Itera e imprime apenas as rotas válidas.
-        for dest, info in sorted(valid_routes.items()):
-            table_str += f"{dest:<10} | {info['cost']:<10.2f} | {info['next_hop']:<15}\n"
-        table_str += "="*55
-        self.logger.info(table_str)
+        # Os índices seguem a ordem alfabética dos IDs (ver idx_to_id), por isso basta
+        # percorrer a tabela por índice para imprimir já ordenado, sem cópia nem sort.
+        idx_to_id = self.idx_to_id
+        any_valid = False
+        for dest_idx, cost in enumerate(self.route_cost):
+            # Imprime apenas as rotas válidas.
+            if cost >= INFINITY:
+                continue
+            any_valid = True
+            next_hop = idx_to_id[self.route_next_hop[dest_idx]]
+            parts.append(f"{idx_to_id[dest_idx]:<10} | {cost:<10.2f} | {next_hop:<15}\n")
+
+        if not any_valid:
+            parts.append(" (Nenhuma rota válida conhecida)\n")
+        parts.append("="*55)
+        # Juntar no fim evita realocar a string a cada linha (+= é quadrático).
+        self.logger.info("".join(parts))
 
     def sync_os_routes(self):
         """
         Sincroniza a tabela de roteamento lógica com a do sistema operacional,
         adicionando rotas válidas e removendo as inválidas (envenenadas).
+
+        Só são visitados os destinos em _pending_os_ops, isto é, os que mudaram desde
+        a última sincronização. Uma rota instalada nunca desaparece da tabela, apenas
+        fica envenenada (e é marcada como pendente nesse momento), por isso não é
+        preciso procurar rotas órfãs.
+
+        As alterações são acumuladas num lote e aplicadas no fim, por netlink
+        (pyroute2) ou com um único processo 'ip -batch'.
         """
-        # Adiciona ou atualiza rotas válidas.
-        for dest_id, route_info in self.routing_table.items():
-            if dest_id == self.router_id: continue
-            destination_prefix = self.network_map.get(dest_id)
+        batch = []
+        installed_routes = self.installed_routes
+        for dest_idx in self._pending_os_ops:
+            cost = self.route_cost[dest_idx]
+            if dest_idx == self.router_idx or self.route_next_hop[dest_idx] == NO_ROUTE: continue
+            destination_prefix = self._prefix_for_idx[dest_idx]
             if not destination_prefix: continue
 
-            if route_info["cost"] >= INFINITY:
+            if cost >= INFINITY:
                 # Se a rota está envenenada, garantimos que ela seja removida do S.O.
-                if destination_prefix in self.installed_routes:
-                    delete_route(destination_prefix, self.logger)
-                    del self.installed_routes[destination_prefix]
+                if installed_routes[dest_idx] is not None:
+                    delete_route(destination_prefix, self.logger, batch)
+                    installed_routes[dest_idx] = None
             else:
                 # Se a rota é válida, garantimos que ela esteja instalada e correta.
-                next_hop_id = route_info.get("next_hop")
-                next_hop_ip = self.neighbors.get(next_hop_id, {}).get("ip")
-                if not next_hop_ip: continue
-                if self.installed_routes.get(destination_prefix) != next_hop_ip:
-                    add_route(destination_prefix, next_hop_ip, self.logger)
-                    self.installed_routes[destination_prefix] = next_hop_ip
-        
-        # Limpeza final: remove do S.O. quaisquer rotas que já não existem de todo na tabela lógica.
-        current_valid_prefixes = {self.network_map.get(dest_id) for dest_id, info in self.routing_table.items() if info["cost"] < INFINITY}
-        for installed_prefix in list(self.installed_routes.keys()):
-            if installed_prefix not in current_valid_prefixes:
-                delete_route(installed_prefix, self.logger)
-                del self.installed_routes[installed_prefix]
+                next_hop = self.neighbors.get(self.route_next_hop[dest_idx])
+                if next_hop is None: continue
+                next_hop_ip = next_hop.ip
+                if installed_routes[dest_idx] != next_hop_ip:
+                    add_route(destination_prefix, next_hop_ip, self.logger, batch)
+                    installed_routes[dest_idx] = next_hop_ip
+        self._pending_os_ops.clear()
+
+        _apply_route_commands(batch, self.logger, self._ipr)
+
+    def _next_wakeup_delay(self) -> float:
+        """
+        Calcula quanto tempo o loop principal pode dormir até ao próximo evento
+        temporizado: o envio periódico, a sincronização adiada com o S.O., o timeout de
+        um vizinho ou o fim de um hold-down. Os dois últimos estão no topo dos heaps.
+
+        Returns:
+            float: O atraso em segundos (nunca negativo).
+        """
+        deadline = self.last_update_sent + UPDATE_INTERVAL
+        if self._dirty_since is not None:
+            deadline = min(deadline, self._last_change + SYNC_DEBOUNCE_INTERVAL,
+                           self._dirty_since + SYNC_MAX_DELAY)
+        if self._expiry_heap:
+            deadline = min(deadline, self._expiry_heap[0][0])
+        if self._hold_down_heap:
+            deadline = min(deadline, self._hold_down_heap[0][0])
+        return max(0.0, deadline - time.monotonic())
+
+    def _drain_socket(self) -> bool:
+        """
+        Lê todos os datagramas pendentes no socket até o kernel não ter mais nada
+        para entregar (BlockingIOError), sempre para o mesmo buffer pré-alocado.
+
+        Returns:
+            bool: True se alguma mensagem alterou a tabela de roteamento.
+        """
+        recv_into = self.sock.recvfrom_into
+        recv_buf = self._recv_buf
+        recv_mv = self._recv_mv
+        process = self.process_incoming_message
+        table_changed = False
+        while True:
+            try:
+                size, addr = recv_into(recv_buf)
+            except BlockingIOError:
+                break # Não há mais pacotes na fila.
+            except ConnectionResetError:
+                continue # É normal se um vizinho for desligado abruptamente.
+            if process(recv_mv[:size], addr):
+                table_changed = True
+        return table_changed
 
     def run(self):
         """
         O loop principal do roteador, que orquestra todas as operações.
+
+        Em vez de acordar a intervalos fixos, o loop bloqueia no seletor até chegar
+        um pacote ou até ao próximo prazo de um temporizador do protocolo.
         """
         self.print_routing_table()
         self.sync_os_routes()
+
+        # Ligações locais para os métodos usados em cada ciclo do loop.
+        now_fn = time.monotonic
+        select = self._sel.select
+        next_wakeup_delay = self._next_wakeup_delay
+        drain = self._drain_socket
+        check_timeouts = self.check_neighbor_timeouts
+        expire_hold_downs = self.expire_hold_down_timers
         
         while True:
-            # A cada ciclo do loop, o roteador realiza as suas três tarefas principais:
+            # A cada ciclo do loop, o roteador realiza as suas quatro tarefas principais:
             
-            # Tarefa 1: Enviar atualizações periódicas para os vizinhos.
-            if time.time() - self.last_update_sent > UPDATE_INTERVAL:
-                self.send_routing_updates()
+            # Tarefa 1: Enviar a mensagem periódica para os vizinhos: a tabela completa
+            # ou apenas um 'hello' (ver send_periodic_message).
+            if now_fn() - self.last_update_sent >= UPDATE_INTERVAL:
+                self.send_periodic_message()
             
-            # Tarefa 2: Processar mensagens recebidas da rede.
+            # Tarefa 2: Esperar por pacotes (ou pelo próximo prazo) e processá-los todos.
             table_changed_by_message = False
-            try:
-                payload, addr = self.sock.recvfrom(4096)
-                table_changed_by_message = self.process_incoming_message(payload, addr)
-            except socket.timeout:
-                pass # É normal não receber pacotes em todos os ciclos.
-            except ConnectionResetError:
-                pass # É normal se um vizinho for desligado abruptamente.
+            if select(timeout=next_wakeup_delay()):
+                table_changed_by_message = drain()
             
-            # Tarefa 3: Verificar se algum vizinho ficou offline.
-            table_changed_by_timeout = self.check_neighbor_timeouts()
+            # Tarefa 3: Verificar se algum vizinho ficou offline e expirar hold-downs.
+            table_changed_by_timeout = check_timeouts()
+            expire_hold_downs()
             
-            # Se a tabela foi alterada por qualquer motivo, imprimimos e sincronizamos.
+            # Se a tabela foi alterada por qualquer motivo, imprimimos e sincronizamos,
+            # mas só quando a rajada de mudanças acalmar (ou se já esperámos demasiado).
+            now = now_fn()
             if table_changed_by_message or table_changed_by_timeout:
+                self._last_change = now
+                if self._dirty_since is None:
+                    self._dirty_since = now
+            if self._dirty_since is not None and (
+                now - self._last_change >= SYNC_DEBOUNCE_INTERVAL
+                or now - self._dirty_since >= SYNC_MAX_DELAY
+            ):
                 self.print_routing_table()
                 self.sync_os_routes()
-            
-            # Pausa para evitar consumo excessivo de CPU.
-            time.sleep(0.1)
+                self._dirty_since = None
+
+            # Tarefa 4: Atualização disparada - enviamos a tabela assim que ela muda.
+            if not self.periodic and self._table_dirty:
+                self.send_routing_updates()
 
 def main():
     """
@@ -445,9 +974,10 @@ def main():
     """
     parser = argparse.ArgumentParser(description="Simple Distance-Vector Router")
     parser.add_argument("--config", type=Path, required=True, help="Caminho para o arquivo de configuração JSON")
+    parser.add_argument("--periodic", action="store_true", help="Envia a tabela completa a cada UPDATE_INTERVAL em vez de só quando muda")
     args = parser.parse_args()
     
-    router = SimpleRouter(args.config)
+    router = SimpleRouter(args.config, periodic=args.periodic)
     # Define o nome do logger principal para o ID do roteador para logs mais claros
     logging.getLogger().name = router.router_id
     router.run()
@@ -0,0 +1,155 @@
+"""
+Verifica que a rede volta a convergir depois da falha de um roteador.
+
+Os roteadores correm no mesmo processo com um relógio simulado: os datagramas
+enviados são entregues diretamente ao process_incoming_message do destino e as
+rotas não são instaladas no S.O.
+"""
+import json
+import logging
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import simple_router as sr
+
+CONFIGS1 = Path(__file__).resolve().parent.parent / "configs1"
+
+
+class SimulatedNetwork:
+    """Conjunto de roteadores ligados entre si por uma rede em memória."""
+
+    def __init__(self, configs: list[dict], tmp_dir: Path):
+        self.clock = 1000.0
+        self.routers = {}
+        self.alive = set()
+        self.by_port = {}
+        self.queue = []
+        self._patchers = [
+            mock.patch.object(sr, "_apply_route_commands"),
+            mock.patch.object(sr.time, "monotonic", lambda: self.clock),
+        ]
+        for patcher in self._patchers:
+            patcher.start()
+        for config in configs:
+            router_id = config["router_id"]
+            self.by_port[config["listen_port"]] = router_id
+            path = tmp_dir / f"config_{router_id}.json"
+            path.write_text(json.dumps({**config, "listen_port": 0}))
+            router = sr.SimpleRouter(path)
+            router._send_datagrams = self._sender(router)
+            self.routers[router_id] = router
+            self.alive.add(router_id)
+
+    def _sender(self, router):
+        def _send_datagrams(datagrams):
+            for payload, (_, port) in datagrams:
+                self.queue.append((router.router_id, self.by_port[port], payload))
+            router.last_update_sent = self.clock
+        return _send_datagrams
+
+    def kill(self, router_id: str):
+        self.alive.discard(router_id)
+
+    def run(self, seconds: int):
+        """Avança o relógio de segundo em segundo, como o ciclo de run()."""
+        for _ in range(seconds):
+            self.clock += 1
+            live = [self.routers[r] for r in sorted(self.alive)]
+            for router in live:
+                if self.clock - router.last_update_sent >= sr.UPDATE_INTERVAL:
+                    router.send_periodic_message()
+            queue, self.queue = self.queue, []
+            for source, destination, payload in queue:
+                if source in self.alive and destination in self.alive:
+                    self.routers[destination].process_incoming_message(payload, (source, 0))
+            for router in live:
+                router.check_neighbor_timeouts()
+                router.expire_hold_down_timers()
+                if not router.periodic and router._table_dirty:
+                    router.send_routing_updates()
+
+    def reachable(self, router_id: str) -> set:
+        router = self.routers[router_id]
+        return {
+            router.idx_to_id[idx]
+            for idx, cost in enumerate(router.route_cost)
+            if idx != router.router_idx
+            and router.route_next_hop[idx] != sr.NO_ROUTE and cost < sr.INFINITY
+        }
+
+    def close(self):
+        for router in self.routers.values():
+            router._sel.close()
+            router.sock.close()
+        for patcher in self._patchers:
+            patcher.stop()
+
+
+def _square_configs() -> list[dict]:
+    """Quadrado A-B, A-C, B-D, C-D."""
+    names = ["a", "b", "c", "d"]
+    links = {"a": ["b", "c"], "b": ["a", "d"], "c": ["a", "d"], "d": ["b", "c"]}
+    network_map = {name: f"10.9.{i}.0/24" for i, name in enumerate(names)}
+    return [
+        {
+            "router_id": name,
+            "listen_port": 6000 + i,
+            "network_map": network_map,
+            "neighbors": [
+                {
+                    "id": other,
+                    "ip": "127.0.0.1",
+                    "port": 6000 + names.index(other),
+                    "metrics": {"bandwidth_mbps": 100, "latency_ms": 10},
+                }
+                for other in links[name]
+            ],
+        }
+        for i, name in enumerate(names)
+    ]
+
+
+class FailoverConvergenceTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp_dir = Path(tmp.name)
+
+    def _start(self, configs: list[dict]):
+        self.net = SimulatedNetwork(configs, self.tmp_dir)
+        self.addCleanup(self.net.close)
+
+    def _assert_full_reachability(self):
+        for router_id in self.net.alive:
+            self.assertEqual(
+                self.net.reachable(router_id), self.net.alive - {router_id}, router_id
+            )
+
+    def test_configs1_reconverges_after_r4_fails(self):
+        self._start([json.loads(p.read_text()) for p in sorted(CONFIGS1.glob("config_*.json"))])
+        self.net.run(60)
+        self._assert_full_reachability()
+
+        self.net.kill("r4")
+        self.net.run(sr.TIMEOUT_INTERVAL + sr.HOLD_DOWN_INTERVAL + 2 * sr.FULL_UPDATE_INTERVAL)
+        self._assert_full_reachability()
+
+    def test_square_reconverges_after_b_fails(self):
+        self._start(_square_configs())
+        self.net.run(60)
+        self._assert_full_reachability()
+
+        self.net.kill("b")
+        self.net.run(sr.TIMEOUT_INTERVAL + sr.HOLD_DOWN_INTERVAL + 2 * sr.FULL_UPDATE_INTERVAL)
+        self._assert_full_reachability()
+
+
+if __name__ == "__main__":
+    unittest.main()